@@ -5,7 +5,10 @@ Start/stop the motor, live speed read-back.
 Scale is treated as RPM per count (e.g. 0.19913 RPM/ct).
 """
 
-import pathlib
+import collections
+import os
+import queue
+import stat
 import threading
 import time
 import tkinter as tk
@@ -24,6 +27,12 @@ VELOCITY_MEAS   = "motor.apiData.velocityMeasured"
 RUN_REQ_VAR     = "motor.apiData.runMotorRequest"
 STOP_REQ_VAR    = "motor.apiData.stopMotorRequest"
 
+# parsed scopes keyed by (elf path, mtime_ns, size) → (port, X2CScope)
+_ELF_CACHE = {}
+
+# pushed by the worker thread once the sequence has finished
+_SEQ_DONE = ("seq-done",)
+
 
 # -------------------------------------------------------------------------
 # Dummy replacements (enable by setting USE_SCOPE = False)
@@ -46,10 +55,40 @@ class _ScopeWrapper:
         self._scope = None
 
     def connect(self, port, elf):
+        st = os.stat(elf)  # raises FileNotFoundError for a missing ELF
+        if not stat.S_ISREG(st.st_mode):
+            raise FileNotFoundError(elf)
         if not USE_SCOPE:
             return
+        key = (elf, st.st_mtime_ns, st.st_size)
+
+        cached = _ELF_CACHE.pop(key, None)
+        if cached is not None and cached[0] == port:
+            scope = cached[1]
+            reopen = getattr(scope, "connect", None)
+            if callable(reopen):
+                try:
+                    reopen()  # re-open the serial link, keep parsed symbols
+                    self._scope = scope
+                    _ELF_CACHE[key] = cached
+                    return
+                except Exception:
+                    # release the port before a fresh instance claims it
+                    try:
+                        scope.disconnect()
+                    except Exception:
+                        pass
+
         self._scope = X2CScope(port=port)
         self._scope.import_variables(elf)
+        self.invalidate(elf)  # older builds of the same file
+        _ELF_CACHE[key] = (port, self._scope)
+
+    @staticmethod
+    def invalidate(elf):
+        """Drop every cached scope parsed from *elf*."""
+        for key in [k for k in _ELF_CACHE if k[0] == elf]:
+            del _ELF_CACHE[key]
 
     def get_variable(self, path):
         if not USE_SCOPE:
@@ -69,6 +108,7 @@ class _ScopeWrapper:
 # -------------------------------------------------------------------------
 class MotorGUI:
     POLL_MS = 500  # speed read-back polling interval
+    FILTER_N = max(1, 2000 // POLL_MS)  # ~2 s measured-speed moving average
 
     def __init__(self):
         self.root = tk.Tk()
@@ -78,6 +118,10 @@ class MotorGUI:
         self.connected = False
         self._thread = None
         self._stop_flag = threading.Event()
+        self._status_q = queue.Queue()  # worker → Tk main thread
+        self._meas_ring = collections.deque(maxlen=self.FILTER_N)
+        self._scale_cached = None  # parsed RPM/count, None when invalid
+        self._unbind_vars()
 
         self._build_widgets()
         self.root.protocol("WM_DELETE_WINDOW", self._on_close)
@@ -100,7 +144,8 @@ class MotorGUI:
 
         ttk.Label(conn, text="COM port:").grid(row=1, column=0, sticky="e", pady=4)
         self.port_var = tk.StringVar()
-        self.port_menu = ttk.OptionMenu(conn, self.port_var, "-", *self._ports())
+        self._ports_cached = tuple(self._ports())
+        self.port_menu = ttk.OptionMenu(conn, self.port_var, "-", *self._ports_cached)
         self.port_menu.grid(row=1, column=1, padx=4, sticky="we")
         ttk.Button(conn, text="↻", width=3, command=self._refresh_ports)\
             .grid(row=1, column=2, padx=4)
@@ -120,11 +165,28 @@ class MotorGUI:
             return e
 
         self.speed_entry = row("Speed (RPM):",      "1500",   0)
-        self.scale_entry = row("Scale (RPM/cnt):",  "0.19913", 1)
+
+        # scale is parsed on edit, not on every poll tick
+        ttk.Label(parms, text="Scale (RPM/cnt):").grid(row=1, column=0, sticky="e")
+        self.scale_var = tk.StringVar(value="0.19913")
+        self.scale_var.trace_add("write", self._recompute_scale)
+        self._recompute_scale()
+        self.scale_entry = ttk.Entry(parms, width=10, textvariable=self.scale_var)
+        self.scale_entry.grid(row=1, column=1, padx=6, pady=2)
+
         self.run_entry   = row("Run time (s):",     "10",     2)
         self.stop_entry  = row("Stop time (s):",    "50",     3)
         self.cycle_entry = row("Iterations:",       "3",      4)
 
+        ttk.Label(parms, text="Filter N:").grid(row=5, column=0, sticky="e")
+        self.filter_var = tk.IntVar(value=self.FILTER_N)
+        filt = ttk.Spinbox(parms, from_=1, to=64, width=8,
+                           textvariable=self.filter_var,
+                           command=self._set_filter_len)
+        filt.grid(row=5, column=1, padx=6, pady=2)
+        filt.bind("<Return>", lambda _e: self._set_filter_len())
+        filt.bind("<FocusOut>", lambda _e: self._set_filter_len())
+
         # Start/Stop buttons ----------------------------------------------
         btn_frm = ttk.Frame(self.root)
         btn_frm.pack(pady=(6, 2))
@@ -165,11 +227,31 @@ class MotorGUI:
         return [p.device for p in serial.tools.list_ports.comports()] or ["-"]
 
     def _refresh_ports(self):
+        new = tuple(self._ports())
+        if new == self._ports_cached:
+            return  # nothing changed – keep menu and selection
         menu = self.port_menu["menu"]
         menu.delete(0, "end")
-        for p in self._ports():
+        for p in new:
             menu.add_command(label=p, command=lambda v=p: self.port_var.set(v))
         self.port_var.set("-")
+        self._ports_cached = new
+
+    def _recompute_scale(self, *_):
+        try:
+            scale = float(self.scale_var.get())
+        except ValueError:
+            scale = 0.0
+        self._scale_cached = scale if scale > 0 else None
+
+    def _set_filter_len(self):
+        try:
+            n = min(max(int(self.filter_var.get()), 1), 64)
+        except (tk.TclError, ValueError):
+            n = self._meas_ring.maxlen
+        self.filter_var.set(n)
+        if n != self._meas_ring.maxlen:
+            self._meas_ring = collections.deque(self._meas_ring, maxlen=n)
 
     def _browse_elf(self):
         fn = filedialog.askopenfilename(
@@ -177,6 +259,7 @@ class MotorGUI:
             filetypes=[("ELF files", "*.elf"), ("All files", "*.*")]
         )
         if fn:
+            _ScopeWrapper.invalidate(fn)
             self.elf_path.set(fn)
 
     # ---------------------------------------------------------------------
@@ -194,10 +277,6 @@ class MotorGUI:
         if port in ("", "-") or not elf:
             messagebox.showwarning("Missing info", "Choose COM port and ELF file.")
             return
-        if not pathlib.Path(elf).is_file():
-            messagebox.showerror("File not found", "ELF file does not exist.")
-            return
-
         try:
             self.scope.connect(port, elf)
             self.hwui_var  = self.scope.get_variable(HWUI_VAR)
@@ -206,19 +285,58 @@ class MotorGUI:
             self.run_var   = self.scope.get_variable(RUN_REQ_VAR)
             self.stop_var  = self.scope.get_variable(STOP_REQ_VAR)
             self.hwui_var.set_value(0)  # disable HW UI on target
+
+            # pre-bound accessors used by the poll loop and worker thread
+            self._get_meas = self.meas_var.get_value
+            self._get_cmd  = self.cmd_var.get_value
+            self._set_cmd  = self.cmd_var.set_value
+            self._set_run  = self.run_var.set_value
+            self._set_stop = self.stop_var.set_value
+            self._last_cmd = None  # force the first command write
+        except FileNotFoundError:
+            messagebox.showerror("File not found", "ELF file does not exist.")
+            return
         except Exception as e:
             messagebox.showerror("Connection failed", str(e))
             return
 
+        self._meas_ring.clear()
         self.connected = True
         self.conn_btn.config(text="Disconnect")
         self.start_btn.config(state="normal")
         self.status.set(f"Connected ({port})")
 
+    def _unbind_vars(self):
+        self._get_meas = self._get_cmd = None
+        self._set_cmd = self._set_run = self._set_stop = None
+        self._last_cmd = None  # last count written to VELOCITY_CMD
+
+    def _join_worker(self):
+        """Stop the sequence thread; True once it has actually exited."""
+        if self._thread and self._thread.is_alive():
+            self._stop_flag.set()
+            self._thread.join(timeout=1.0)
+        return not (self._thread and self._thread.is_alive())
+
+    def _discard_status(self):
+        # drop worker messages that would otherwise outlive this link
+        while True:
+            try:
+                self._status_q.get_nowait()
+            except queue.Empty:
+                break
+
     def _disconnect(self):
+        if not self._join_worker():
+            # worker is stuck in a write – keep the link open under it
+            self.status.set("Sequence still stopping – try Disconnect again")
+            return
+        self._discard_status()
         if getattr(self, "stop_var", None):
             self.stop_var.set_value(1)
         self.scope.disconnect()
+        self._unbind_vars()
+        self._meas_ring.clear()
 
         self.connected = False
         self.start_btn.config(state="disabled")
@@ -235,12 +353,12 @@ class MotorGUI:
 
         try:
             rpm    = float(self.speed_entry.get())
-            scale  = float(self.scale_entry.get())   # RPM per count
+            scale  = self._scale_cached               # RPM per count
             run_t  = float(self.run_entry.get())
             stop_t = float(self.stop_entry.get())
             cycles = int(self.cycle_entry.get())
 
-            if scale <= 0 or run_t <= 0 or stop_t < 0 or cycles <= 0:
+            if scale is None or run_t <= 0 or stop_t < 0 or cycles <= 0:
                 raise ValueError
         except ValueError:
             messagebox.showerror("Input error", "Enter valid numeric values.")
@@ -265,70 +383,97 @@ class MotorGUI:
             self.stop_var.set_value(1)
             self.status.set("Stopping…")
 
+    def _wait_until(self, deadline):
+        """Block until the monotonic *deadline*; True if stopped early."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return self._stop_flag.is_set()
+        return self._stop_flag.wait(remaining)
+
     def _run_sequence(self):
         rpm, scale, run_t, stop_t, cycles = self.params
         cnt_cmd = int(round(rpm / scale))  # RPM → counts
+        # local snapshot: _disconnect may unbind the accessors meanwhile
+        set_cmd, set_run, set_stop = self._set_cmd, self._set_run, self._set_stop
 
-        for n in range(1, cycles + 1):
-            if self._stop_flag.is_set():
-                break
-
-            # RUN phase
-            self.status.set(f"Cycle {n}/{cycles}: RUN @ {rpm:.0f} RPM")
-            self.cmd_var.set_value(cnt_cmd)
-            self.run_var.set_value(1)
-
-            t0 = time.time()
-            while time.time() - t0 < run_t:
+        error = None
+        try:
+            for n in range(1, cycles + 1):
                 if self._stop_flag.is_set():
                     break
-                time.sleep(0.05)
 
-            if self._stop_flag.is_set():
-                break
+                # RUN phase
+                deadline = time.monotonic() + run_t
+                self._status_q.put(f"Cycle {n}/{cycles}: RUN @ {rpm:.0f} RPM")
+                if self._last_cmd != cnt_cmd:
+                    set_cmd(cnt_cmd)
+                    self._last_cmd = cnt_cmd
+                set_run(1)  # request flag, consumed by the target
 
-            # STOP phase
-            self.status.set(f"Cycle {n}/{cycles}: STOP")
-            self.stop_var.set_value(1)
-
-            t0 = time.time()
-            while time.time() - t0 < stop_t:
-                if self._stop_flag.is_set():
+                if self._wait_until(deadline):
                     break
-                time.sleep(0.05)
 
-        # ensure motor is stopped
-        if getattr(self, "stop_var", None):
-            self.stop_var.set_value(1)
+                # STOP phase
+                deadline = time.monotonic() + stop_t
+                self._status_q.put(f"Cycle {n}/{cycles}: STOP")
+                set_stop(1)
 
-        self.status.set(
-            "Stopped by user" if self._stop_flag.is_set() else "Done – motor idle"
-        )
-        self.root.after(
-            0, lambda: (
-                self.start_btn.config(state="normal"),
-                self.stop_btn.config(state="disabled"),
-            )
-        )
+                if self._wait_until(deadline):
+                    break
+        except Exception as e:
+            error = e
+        finally:
+            # ensure motor is stopped (best effort – the link may be gone)
+            try:
+                set_stop(1)
+            except Exception:
+                pass
+
+            if error is not None:
+                msg = f"Sequence aborted: {error}"
+            elif self._stop_flag.is_set():
+                msg = "Stopped by user"
+            else:
+                msg = "Done – motor idle"
+            self._status_q.put(msg)
+            self._status_q.put(_SEQ_DONE)  # always re-enable the buttons
 
     # ---------------------------------------------------------------------
     # Speed polling
     # ---------------------------------------------------------------------
+    def _drain_status(self):
+        while True:
+            try:
+                msg = self._status_q.get_nowait()
+            except queue.Empty:
+                break
+            if msg is _SEQ_DONE:
+                self.start_btn.config(
+                    state="normal" if self.connected else "disabled")
+                self.stop_btn.config(state="disabled")
+            else:
+                self.status.set(msg)
+
     def _poll_speeds(self):
+        self._drain_status()
+
         if self.connected:
             try:
-                cnt_meas = self.meas_var.get_value()
-                cnt_cmd  = self.cmd_var.get_value()
+                cnt_meas = self._get_meas()
+                cnt_cmd  = self._get_cmd()
+                self._meas_ring.append(cnt_meas)
+                ring = self._meas_ring
+                avg = sum(ring) / len(ring)
             except Exception:
-                cnt_meas = cnt_cmd = 0
+                avg = cnt_cmd = None
 
-            try:
-                scale = float(self.scale_entry.get())
-                rpm_meas = cnt_meas * scale
+            scale = self._scale_cached
+            if scale is not None and avg is not None:
+                rpm_meas = avg * scale
                 rpm_cmd  = cnt_cmd  * scale
-                self.meas_str.set(f"{rpm_meas:+.0f} RPM ({cnt_meas})")
+                self.meas_str.set(f"{rpm_meas:+.0f} RPM ({avg:.0f})")
                 self.cmd_str .set(f"{rpm_cmd:+.0f} RPM ({cnt_cmd})")
-            except ValueError:
+            else:
                 self.meas_str.set("—")
                 self.cmd_str.set("—")
         else:
@@ -342,6 +487,9 @@ class MotorGUI:
     # ---------------------------------------------------------------------
     def _on_close(self):
         try:
+            # closing anyway: a still-running worker's writes fail safely
+            self._join_worker()
+            self._discard_status()
             if getattr(self, "stop_var", None):
                 self.stop_var.set_value(1)
             self.scope.disconnect()